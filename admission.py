@@ -0,0 +1,216 @@
+import itertools
+import math
+import os
+import threading
+import time
+from bisect import insort
+
+from flask import g, jsonify, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+
+# Limits are per worker process (threads share them); gunicorn.conf.py sizes the thread pool from them
+ADMISSION_ENABLED = os.environ.get('API650_ADMISSION_ENABLED', '1') == '1'
+MAX_CONCURRENT = int(os.environ.get('API650_ADMISSION_MAX_CONCURRENT', '8'))
+BULK_MAX_CONCURRENT = int(os.environ.get('API650_ADMISSION_BULK_MAX_CONCURRENT', '3'))
+PER_CLIENT_MAX = int(os.environ.get('API650_ADMISSION_PER_CLIENT_MAX', '4'))
+INTERACTIVE_QUEUE_MAX = int(os.environ.get('API650_ADMISSION_INTERACTIVE_QUEUE_MAX', '32'))
+BULK_QUEUE_MAX = int(os.environ.get('API650_ADMISSION_BULK_QUEUE_MAX', '4'))
+BULK_QUEUE_MAX_COST = float(os.environ.get('API650_ADMISSION_BULK_QUEUE_MAX_COST', '2000'))
+INTERACTIVE_WAIT_S = float(os.environ.get('API650_ADMISSION_INTERACTIVE_WAIT_S', '2'))
+BULK_WAIT_S = float(os.environ.get('API650_ADMISSION_BULK_WAIT_S', '10'))
+BULK_COST_THRESHOLD = float(os.environ.get('API650_ADMISSION_BULK_COST', '50'))
+# Reverse proxies in front of the app (the hosting router counts as one); 0 = direct exposure
+TRUSTED_PROXY_HOPS = int(os.environ.get('API650_TRUSTED_PROXY_HOPS', '1'))
+
+INTERACTIVE, BULK = 0, 1   # queue priority: lower runs first
+
+
+def required_threads():
+    """Worker threads needed so every admitted or queued request holds its own thread
+
+    Queued requests park their thread; with fewer threads than running + both queue caps,
+    parked bulk calls can exhaust the pool and interactive requests would wait in gunicorn's
+    FIFO instead of reaching the priority queue.
+    """
+    return MAX_CONCURRENT + INTERACTIVE_QUEUE_MAX + BULK_QUEUE_MAX
+
+
+def route_cost(estimate=None, bulk=False):
+    """Tag a view with a cost estimator (request JSON -> units) and/or as always-bulk"""
+    def decorate(fn):
+        fn._admission_cost = estimate
+        fn._admission_bulk = bulk
+        return fn
+    return decorate
+
+
+class Rejected(Exception):
+    def __init__(self, status, retry_after, reason):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """Slot scheduler: interactive first, bulk capped, bounded queues, per-client limit"""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, bulk_max_concurrent=BULK_MAX_CONCURRENT,
+                 per_client_max=PER_CLIENT_MAX, interactive_queue_max=INTERACTIVE_QUEUE_MAX,
+                 bulk_queue_max=BULK_QUEUE_MAX, bulk_queue_max_cost=BULK_QUEUE_MAX_COST):
+        self.max_concurrent = max_concurrent
+        self.bulk_max_concurrent = min(bulk_max_concurrent, max_concurrent)
+        self.per_client_max = per_client_max
+        self.interactive_queue_max = interactive_queue_max
+        self.bulk_queue_max = bulk_queue_max
+        self.bulk_queue_max_cost = bulk_queue_max_cost
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting = []          # sorted (priority, seq): interactive first, then FIFO
+        self._queued = [0, 0]       # waiters per class
+        self._queued_bulk_cost = 0.0
+        self._running = [0, 0]
+        self._clients = {}
+        self._service_s = [0.05, 1.0]   # EWMA service time per class for Retry-After
+
+    def _retry_after(self, klass):
+        slots = self.max_concurrent if klass == INTERACTIVE else self.bulk_max_concurrent
+        backlog = self._queued[klass] + self._running[klass]
+        return max(1, math.ceil(self._service_s[klass] * backlog / max(slots, 1)))
+
+    def _can_run(self, klass):
+        if self._running[0] + self._running[1] >= self.max_concurrent:
+            return False
+        return klass == INTERACTIVE or self._running[BULK] < self.bulk_max_concurrent
+
+    def _first_runnable(self):
+        # Bulk never overtakes a waiting interactive request
+        for prio, seq in self._waiting:
+            if self._can_run(prio):
+                return seq
+            if prio == INTERACTIVE:
+                return None
+        return None
+
+    def acquire(self, client, klass, cost, timeout):
+        with self._cond:
+            if self._clients.get(client, 0) >= self.per_client_max:
+                raise Rejected(429, self._retry_after(klass), 'too many concurrent requests from client')
+            if not self._waiting and self._can_run(klass):
+                self._admit(client, klass)
+                return
+            if klass == INTERACTIVE and self._queued[INTERACTIVE] >= self.interactive_queue_max:
+                raise Rejected(503, self._retry_after(klass), 'interactive queue full')
+            if klass == BULK and (self._queued[BULK] >= self.bulk_queue_max
+                                  or self._queued_bulk_cost + cost > self.bulk_queue_max_cost):
+                raise Rejected(503, self._retry_after(klass), 'bulk queue full')
+            seq = next(self._seq)
+            insort(self._waiting, (klass, seq))
+            self._queued[klass] += 1
+            if klass == BULK:
+                self._queued_bulk_cost += cost
+            self._clients[client] = self._clients.get(client, 0) + 1   # queued counts toward the client cap
+            deadline = time.monotonic() + timeout
+            try:
+                while self._first_runnable() != seq:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Rejected(503, self._retry_after(klass), 'queue wait exceeded')
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove((klass, seq))
+                self._queued[klass] -= 1
+                if klass == BULK:
+                    self._queued_bulk_cost -= cost
+                self._release_client(client)
+                # Removing a waiter may unblock the next one
+                self._cond.notify_all()
+            self._admit(client, klass)
+
+    def _admit(self, client, klass):
+        self._running[klass] += 1
+        self._clients[client] = self._clients.get(client, 0) + 1
+
+    def _release_client(self, client):
+        n = self._clients.get(client, 0) - 1
+        if n > 0:
+            self._clients[client] = n
+        else:
+            self._clients.pop(client, None)
+
+    def release(self, client, klass, elapsed_s):
+        with self._cond:
+            self._running[klass] -= 1
+            self._release_client(client)
+            self._service_s[klass] = 0.8 * self._service_s[klass] + 0.2 * elapsed_s
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'running_interactive': self._running[INTERACTIVE],
+                'running_bulk': self._running[BULK],
+                'queued_interactive': self._queued[INTERACTIVE],
+                'queued_bulk': self._queued[BULK],
+                'queued_bulk_cost': self._queued_bulk_cost,
+                'clients': len(self._clients)
+            }
+
+
+def _classify(view):
+    """(class, cost) for the current request from the view's route_cost tag"""
+    estimate = getattr(view, '_admission_cost', None)
+    cost = 1.0
+    if estimate is not None:
+        try:
+            cost = max(1.0, float(estimate(request.get_json(silent=True) or {})))
+        except Exception:
+            cost = 1.0   # bad payloads are rejected by the view itself
+    bulk = getattr(view, '_admission_bulk', False) or cost > BULK_COST_THRESHOLD
+    return (BULK if bulk else INTERACTIVE), cost
+
+
+def _client_id():
+    # remote_addr is the real client once ProxyFix has consumed the trusted X-Forwarded-For hops
+    return request.remote_addr or 'unknown'
+
+
+def init_app(app, controller=None):
+    """Gate every API request through the admission controller"""
+    if not ADMISSION_ENABLED:
+        return None
+    controller = controller or AdmissionController()
+    if TRUSTED_PROXY_HOPS > 0:
+        # Without this every user behind the router shares one client id and PER_CLIENT_MAX
+        # becomes a site-wide cap
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
+    @app.before_request
+    def _admit_request():
+        if not request.path.startswith('/api/'):
+            return None
+        view = app.view_functions.get(request.endpoint)
+        if view is None:
+            return None
+        klass, cost = _classify(view)
+        client = _client_id()
+        try:
+            controller.acquire(client, klass, cost, INTERACTIVE_WAIT_S if klass == INTERACTIVE else BULK_WAIT_S)
+        except Rejected as r:
+            response = jsonify({'error': r.reason, 'retry_after_s': r.retry_after})
+            response.status_code = r.status
+            response.headers['Retry-After'] = str(r.retry_after)
+            return response
+        g._admission = (client, klass, time.perf_counter())
+        return None
+
+    @app.teardown_request
+    def _release_request(exc):
+        state = g.pop('_admission', None)
+        if state is not None:
+            client, klass, t0 = state
+            controller.release(client, klass, time.perf_counter() - t0)
+
+    app.extensions['admission'] = controller
+    return controller
@@ -0,0 +1,139 @@
+import math
+from functools import lru_cache
+
+
+# Metric coarse anchor bolts: nominal d (mm) -> pitch (mm)
+BOLT_SIZES = [
+    (27, 3.0), (30, 3.5), (33, 3.5), (36, 4.0), (39, 4.0), (42, 4.5),
+    (45, 4.5), (48, 5.0), (52, 5.0), (56, 5.5), (64, 6.0), (72, 6.0), (80, 6.0)
+]
+MIN_BOLT_DIAMETER_MM = 25.0   # 5.12.3: 1 in. (25 mm) excluding corrosion allowance
+MAX_BOLT_SPACING_M = 3.0      # 5.12.3
+CHAIR_PLATE_ALLOW_MPa = 172.0  # 25 ksi, AISI E-1 Vol. II Part 5
+
+
+def bolt_net_area_mm2(d_mm, pitch_mm, CA_mm=0.0):
+    """Tensile stress area with corrosion allowance taken off the diameter"""
+    d_s = d_mm - 0.9382 * pitch_mm - CA_mm
+    return math.pi / 4.0 * max(d_s, 0.0) ** 2
+
+
+@lru_cache(maxsize=256)
+def bolt_circle(N, direction_deg=0.0):
+    """Precomputed cos(theta_j - psi) for N equally spaced bolts; bolt 1 at 0 deg"""
+    psi = math.radians(direction_deg)
+    return tuple(math.cos(2.0 * math.pi * j / N - psi) for j in range(N))
+
+
+def uplift_cases(D_m, P_kPa=0.0, Pt_kPa=0.0, Pf_kPa=0.0, th_mm=5.0, Mwh_Nm=0.0, PWR_kPa=0.0,
+                 Mrw_Nm=0.0, Av=0.0, W1_N=0.0, W2_N=0.0, W3_N=0.0, Fp=0.4, bolt_fy_MPa=250.0,
+                 frangible=False):
+    """Table 5.21b uplift load cases as (name, uniform N, overturning N, allowable bolt MPa)
+
+    Total uplift U = uniform + overturning matches Table 5.21b; the overturning part is
+    4M/D and is shared between bolts as cos(theta) around the circumference.
+    """
+    A = D_m ** 2 * 785.0  # pi/4 * 1000: kPa * m2 -> N
+    # Fp combines the design pressure only; the roof plate weight (0.08 th) is always taken in full
+    roof = 0.08 * th_mm
+    wind_roof = PWR_kPa * A
+    cases = [
+        ('design_pressure', (P_kPa - roof) * A - W1_N, 0.0, 105.0),
+        ('test_pressure', (Pt_kPa - roof) * A - W1_N, 0.0, 140.0),
+        ('wind', wind_roof - W2_N, 4.0 * Mwh_Nm / D_m, 0.8 * bolt_fy_MPa),
+        ('seismic', -W2_N * (1.0 - 0.4 * Av), 4.0 * Mrw_Nm / D_m, 0.8 * bolt_fy_MPa),
+        ('design_pressure_wind', (Fp * P_kPa + PWR_kPa - roof) * A - W1_N, 4.0 * Mwh_Nm / D_m, 140.0),
+        ('design_pressure_seismic', (Fp * P_kPa - roof) * A - W1_N * (1.0 - 0.4 * Av),
+         4.0 * Mrw_Nm / D_m, 0.8 * bolt_fy_MPa),
+    ]
+    if Pf_kPa > 0:
+        cases.append(('failure_pressure', (1.5 * Pf_kPa - roof) * A - W3_N, 0.0, bolt_fy_MPa))
+        if frangible:
+            cases.append(('frangible_roof', (3.0 * Pf_kPa - roof) * A - W3_N, 0.0, bolt_fy_MPa))
+    return cases
+
+
+def position_matrix(cases, N, direction_deg=0.0):
+    """Bolt load (N) for every case x bolt position in one pass over the precomputed circle"""
+    cos_t = bolt_circle(N, direction_deg)
+    inv = 1.0 / N
+    return [[(a + b * c) * inv for c in cos_t] for _, a, b, _ in cases]
+
+
+def select_bolt(A_req_mm2, CA_mm, max_d_mm=None):
+    for d, pitch in BOLT_SIZES:
+        if max_d_mm is not None and d > max_d_mm:
+            break
+        if d - CA_mm < MIN_BOLT_DIAMETER_MM:
+            continue   # 5.12.3 minimum applies to the corroded diameter
+        if bolt_net_area_mm2(d, pitch, CA_mm) >= A_req_mm2:
+            return d, pitch
+    return None, None
+
+
+def min_bolt_eccentricity_mm(d_mm):
+    """AISI E-1 minimum bolt eccentricity from the shell: 0.886 d + 0.572 in."""
+    return 0.886 * d_mm + 0.572 * 25.4
+
+
+def chair_size(P_N, d_mm, chair_height_mm=300.0, e_mm=None, f_MPa=CHAIR_PLATE_ALLOW_MPa):
+    """AISI E-1 anchor chair: top plate c = sqrt(P/(f e) (0.375 g - 0.22 d)), gusset j"""
+    g = math.ceil((d_mm + 2 * 25.0) / 5.0) * 5.0      # gusset spacing: bolt + 25 mm each side
+    # e = bolt eccentricity from the shell outer surface, never below the AISI minimum
+    e = max(float(e_mm or 0.0), min_bolt_eccentricity_mm(d_mm))
+    e = math.ceil(e / 5.0) * 5.0
+    c = math.sqrt(max(P_N, 0.0) / (f_MPa * e) * max(0.375 * g - 0.22 * d_mm, 0.0))
+    c = max(math.ceil(c / 2.0) * 2.0, 12.0)
+    j = max(0.04 * (chair_height_mm - c), 12.0)
+    return {
+        'top_plate_thickness_mm': c,
+        'gusset_thickness_mm': math.ceil(j / 2.0) * 2.0,
+        'gusset_spacing_mm': g,
+        'bolt_eccentricity_mm': e,
+        'chair_height_mm': chair_height_mm
+    }
+
+
+def design_anchorage(D_m, cases, CA_bolt_mm=3.0, num_bolts=None, direction_deg=0.0,
+                     chair_height_mm=300.0, max_bolt_d_mm=52, bolt_eccentricity_mm=None):
+    """Size bolts/chairs; adds bolts (multiples of 4) until max_bolt_d_mm suffices unless N is fixed"""
+    n_min = 4 * math.ceil(math.pi * D_m / MAX_BOLT_SPACING_M / 4)   # smallest multiple of 4 within spacing
+    if num_bolts is not None:
+        N = int(num_bolts)
+        if N <= 0 or N % 4 or N != float(num_bolts):
+            raise ValueError('num_bolts must be a positive multiple of 4')
+        if N < n_min:
+            raise ValueError(f'num_bolts must be at least {n_min} to keep bolt spacing within '
+                             f'{MAX_BOLT_SPACING_M:g} m (5.12.3)')
+        counts = [N]
+    else:
+        counts = range(n_min, max(n_min, 4 * math.ceil(math.pi * D_m / 0.5 / 4)) + 1, 4)
+    largest = max((b for b in BOLT_SIZES if b[0] <= max_bolt_d_mm), default=BOLT_SIZES[0])
+    for N in counts:
+        matrix = position_matrix(cases, N, direction_deg)
+        governing = None
+        for (name, a, b, allow), row in zip(cases, matrix):
+            F = max(row)
+            if F <= 0:
+                continue
+            A_req = F / allow
+            if governing is None or A_req > governing['A_req']:
+                governing = {'case': name, 'F': F, 'A_req': A_req, 'allow': allow,
+                             'position': row.index(F) + 1}
+        if governing is None:
+            return {'required': False, 'N': N, 'matrix': matrix}
+        if bolt_net_area_mm2(largest[0], largest[1], CA_bolt_mm) >= governing['A_req'] or N == counts[-1]:
+            d, pitch = select_bolt(governing['A_req'], CA_bolt_mm, max_bolt_d_mm)
+            if d is None:
+                raise ValueError(
+                    f"no bolt up to {max_bolt_d_mm:g} mm provides {governing['A_req']:.0f} mm2 net area "
+                    f"with {N} bolts; increase num_bolts or max_bolt_diameter_mm")
+            return {
+                'required': True,
+                'N': N,
+                'matrix': matrix,
+                'governing': governing,
+                'bolt_d_mm': d,
+                'bolt_net_area_mm2': bolt_net_area_mm2(d, pitch, CA_bolt_mm),
+                'chair': chair_size(governing['F'], d, chair_height_mm, bolt_eccentricity_mm)
+            }
@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+
+from flask import abort, make_response, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt; without it only gzip variants are built
+    brotli = None
+
+
+ASSETS_FINGERPRINT = os.environ.get('API650_ASSETS_FINGERPRINT', '1') == '1'
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = os.path.join(DIST_DIR, 'manifest.json')
+
+COMPRESSIBLE = ('.js', '.css', '.svg', '.json', '.html', '.txt')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _write_atomic(path, data):
+    tmp = '%s.tmp%d' % (path, os.getpid())
+    with open(tmp, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Copy static files to dist/ as name.<hash>.ext with .gz/.br siblings; return the manifest"""
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root).startswith(os.path.abspath(dist_dir)):
+            continue
+        for name in sorted(files):
+            src = os.path.join(root, name)
+            rel = os.path.relpath(src, static_dir).replace(os.sep, '/')
+            with open(src, 'rb') as fh:
+                data = fh.read()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            stem, ext = os.path.splitext(rel)
+            out_rel = f'{stem}.{digest}{ext}'
+            out = os.path.join(dist_dir, out_rel)
+            manifest[rel] = out_rel
+            if os.path.exists(out):
+                continue  # same content hash already built
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            if ext.lower() in COMPRESSIBLE:
+                _write_atomic(out + '.gz', gzip.compress(data, 9, mtime=0))
+                if brotli is not None:
+                    _write_atomic(out + '.br', brotli.compress(data, quality=11))
+            _write_atomic(out, data)
+    os.makedirs(dist_dir, exist_ok=True)
+    _write_atomic(os.path.join(dist_dir, 'manifest.json'), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest():
+    """Read dist/manifest.json, building it first if missing or stale"""
+    try:
+        with open(MANIFEST) as fh:
+            manifest = json.load(fh)
+        if all(os.path.isfile(os.path.join(DIST_DIR, v)) for v in manifest.values()):
+            newest = max((os.path.getmtime(os.path.join(STATIC_DIR, k)) for k in manifest
+                          if os.path.isfile(os.path.join(STATIC_DIR, k))), default=0)
+            if newest <= os.path.getmtime(MANIFEST):
+                return manifest
+    except (OSError, ValueError):
+        pass
+    return build()
+
+
+def _accepts(encoding):
+    # Quality-aware: "gzip;q=0" refuses gzip, "*" accepts anything not listed
+    return request.accept_encodings[encoding] > 0
+
+
+def serve(filename):
+    """Fingerprinted asset with the best precompressed variant the client accepts"""
+    path = os.path.normpath(os.path.join(DIST_DIR, filename))
+    if not path.startswith(DIST_DIR + os.sep) or not os.path.isfile(path):
+        abort(404)
+    encoding = None
+    for enc, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if _accepts(enc) and os.path.isfile(path + suffix):
+            encoding = enc
+            path = path + suffix
+            break
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True, max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+_pages = {}
+
+
+def cached_page(key, render):
+    """Render once per process; serve with ETag revalidation and an in-memory gzip variant"""
+    page = _pages.get(key)
+    if page is None:
+        body = render().encode('utf-8')
+        page = _pages[key] = (body, gzip.compress(body, 9, mtime=0), hashlib.sha256(body).hexdigest()[:16])
+    body, gz, etag = page
+    if _accepts('gzip'):
+        response = make_response(gz)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag + '-gz')
+    else:
+        response = make_response(body)
+        response.set_etag(etag)
+    response.mimetype = 'text/html'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response.make_conditional(request)
+
+
+def init_app(app):
+    """Expose asset_url() to templates; fingerprinted under /assets/ unless disabled"""
+    manifest = None
+    if ASSETS_FINGERPRINT:
+        try:
+            manifest = load_manifest()
+        except OSError as e:
+            # e.g. read-only filesystem: keep serving plain /static URLs rather than failing to start
+            app.logger.warning('asset build failed, serving unfingerprinted static files: %s', e)
+
+    def asset_url(filename):
+        if manifest and filename in manifest:
+            return url_for('fingerprinted_asset', filename=manifest[filename])
+        return url_for('static', filename=filename)
+
+    app.add_url_rule('/assets/<path:filename>', 'fingerprinted_asset', serve)
+    app.jinja_env.globals['asset_url'] = asset_url
+    return manifest
+
+
+if __name__ == '__main__':
+    # Deploy-time build: python assets.py
+    m = build()
+    sys.stdout.write('built %d assets into %s%s\n' % (len(m), DIST_DIR, '' if brotli else ' (no brotli module: gzip only)'))
@@ -0,0 +1,176 @@
+import json
+import math
+
+
+# Flush the response stream in chunks of roughly this many characters
+STREAM_CHUNK = 65536
+
+
+def _ring(r, z, n):
+    return [(r * math.cos(2.0 * math.pi * k / n), r * math.sin(2.0 * math.pi * k / n), z) for k in range(n)]
+
+
+def _band(r0, z0, r1, z1, n):
+    """Quads between two horizontal circles (cylinder, cone or annulus depending on r/z)"""
+    a = _ring(r0, z0, n)
+    b = _ring(r1, z1, n)
+    for k in range(n):
+        k1 = (k + 1) % n
+        yield (a[k], a[k1], b[k1], b[k])
+
+
+def _disc(r, z, n):
+    c = (0.0, 0.0, z)
+    ring = _ring(r, z, n)
+    for k in range(n):
+        yield (c, ring[k], ring[(k + 1) % n])
+
+
+def _nozzle(R_shell, elevation, angle_deg, OD, projection, n):
+    """Radial cylinder from the shell surface outwards"""
+    th = math.radians(angle_deg)
+    ux, uy = math.cos(th), math.sin(th)       # axis
+    vx, vy = -math.sin(th), math.cos(th)      # circumferential
+    r = OD / 2.0
+
+    def circle(s):
+        pts = []
+        for k in range(n):
+            a = 2.0 * math.pi * k / n
+            ca, sa = r * math.cos(a), r * math.sin(a)
+            pts.append(((R_shell + s) * ux + ca * vx, (R_shell + s) * uy + ca * vy, elevation + sa))
+        return pts
+
+    a = circle(0.0)
+    b = circle(projection)
+    for k in range(n):
+        k1 = (k + 1) % n
+        yield (a[k], a[k1], b[k1], b[k])
+
+
+ROOF_TYPES = ('cone', 'flat')
+SEGMENTS_RANGE = (12, 720)   # facets per circle; 720 = 0.5 deg, output grows linearly
+
+
+def normalise_nozzles(nozzles):
+    """Validate nozzle inputs up front (parts are generated lazily while the response streams)"""
+    if nozzles is None:
+        return []
+    if not isinstance(nozzles, list):
+        raise ValueError('nozzles must be a list')
+    out = []
+    for k, nz in enumerate(nozzles):
+        if not isinstance(nz, dict):
+            raise ValueError(f'nozzle {k + 1} must be an object')
+        try:
+            OD_mm = float(nz['OD_mm']) if nz.get('OD_mm') else float(nz.get('NPS_inch', 4)) * 25.4
+            row = {
+                'tag': str(nz.get('tag') or f'N{k + 1}'),
+                'OD_mm': OD_mm,
+                'elevation_m': float(nz.get('elevation_m', 0.5)),
+                'orientation_deg': float(nz.get('orientation_deg', 0.0)),
+                'projection_mm': float(nz.get('projection_mm', 200.0))
+            }
+        except (TypeError, ValueError):
+            raise ValueError(f'nozzle {k + 1}: OD_mm/NPS_inch, elevation_m, orientation_deg and projection_mm must be numbers')
+        if not all(math.isfinite(v) for v in row.values() if isinstance(v, float)):
+            raise ValueError(f'nozzle {k + 1}: values must be finite')
+        if row['OD_mm'] <= 0 or row['projection_mm'] <= 0:
+            raise ValueError(f'nozzle {k + 1}: OD_mm and projection_mm must be positive')
+        out.append(row)
+    return out
+
+
+def tank_parts(D_m, H_m, plate_width_mm=2000.0, course_tr_mm=None, ring_elevations_m=None,
+               ring_width_mm=150.0, bottom_projection_mm=50.0, annular_width_mm=0.0,
+               roof='cone', roof_slope=1.0 / 16.0, nozzles=None, segments=72):
+    """Yield (layer, name, facet generator) for every tank component; units are metres"""
+    R = D_m / 2.0
+    pw = plate_width_mm / 1000.0
+    num_courses = max(1, math.ceil(H_m / pw - 1e-9))
+    for i in range(num_courses):
+        z0 = i * pw
+        z1 = min(z0 + pw, H_m)
+        t = course_tr_mm[i] if course_tr_mm and i < len(course_tr_mm) else None
+        name = f'course {i + 1}' + (f' t={t} mm' if t else '')
+        yield 'SHELL', name, _band(R, z0, R, z1, segments)
+
+    for j, z in enumerate(ring_elevations_m or []):
+        yield 'WIND_GIRDER', f'girder {j + 1} @ {z} m', _band(R, z, R + ring_width_mm / 1000.0, z, segments)
+
+    r_bottom = R + bottom_projection_mm / 1000.0
+    if annular_width_mm > 0:
+        r_in = max(r_bottom - annular_width_mm / 1000.0, 0.0)
+        yield 'ANNULAR', 'annular plates', _band(r_in, 0.0, r_bottom, 0.0, segments)
+        yield 'BOTTOM', 'bottom plates', _disc(r_in, 0.0, segments)
+    else:
+        yield 'BOTTOM', 'bottom plates', _disc(r_bottom, 0.0, segments)
+
+    if roof == 'flat':
+        yield 'ROOF', 'roof plates', _disc(R, H_m, segments)
+    else:
+        # Cone roof: rise = R * slope; apex over the centre
+        yield 'ROOF', 'roof plates', _band(R, H_m, 0.0, H_m + R * roof_slope, segments)
+
+    # nozzles as returned by normalise_nozzles
+    for nz in nozzles or []:
+        yield ('NOZZLE', nz['tag'],
+               _nozzle(R, nz['elevation_m'], nz['orientation_deg'], nz['OD_mm'] / 1000.0,
+                       nz['projection_mm'] / 1000.0, max(12, segments // 4)))
+
+
+def _chunked(pieces):
+    buf = []
+    size = 0
+    for p in pieces:
+        buf.append(p)
+        size += len(p)
+        if size >= STREAM_CHUNK:
+            yield ''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield ''.join(buf)
+
+
+def _dxf_pieces(parts):
+    # AutoCAD R12 ASCII, ENTITIES-only; coordinates in millimetres
+    yield '0\nSECTION\n2\nHEADER\n9\n$ACADVER\n1\nAC1009\n0\nENDSEC\n'
+    yield '0\nSECTION\n2\nENTITIES\n'
+    for layer, name, facets in parts:
+        for f in facets:
+            pts = f if len(f) == 4 else (f[0], f[1], f[2], f[2])
+            out = ['0\n3DFACE\n8\n', layer, '\n']
+            for idx, (x, y, z) in enumerate(pts):
+                out.append(f'1{idx}\n{x * 1000.0:.3f}\n2{idx}\n{y * 1000.0:.3f}\n3{idx}\n{z * 1000.0:.3f}\n')
+            yield ''.join(out)
+    yield '0\nENDSEC\n0\nEOF\n'
+
+
+def dxf_stream(parts):
+    return _chunked(_dxf_pieces(parts))
+
+
+def _mesh_pieces(parts, meta):
+    # One JSON document, written mesh by mesh; only a single part is buffered at a time
+    yield '{"asset":' + json.dumps(meta) + ',"units":"m","meshes":['
+    first = True
+    for layer, name, facets in parts:
+        positions = []
+        indices = []
+        for f in facets:
+            base = len(positions) // 3
+            for p in f:
+                positions.extend(round(c, 4) for c in p)
+            indices.extend((base, base + 1, base + 2))
+            if len(f) == 4:
+                indices.extend((base, base + 2, base + 3))
+        yield ('' if first else ',') + json.dumps(
+            {'name': name, 'layer': layer, 'positions': positions, 'indices': indices},
+            separators=(',', ':'))
+        first = False
+    yield ']}'
+
+
+def mesh_stream(parts, meta=None):
+    return _chunked(_mesh_pieces(parts, meta or {'generator': 'api650 cad export'}))
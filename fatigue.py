@@ -0,0 +1,356 @@
+import argparse
+import csv
+import json
+import math
+import mmap
+import os
+import sys
+
+
+# Hydrostatic head constant shared with calculate_shell: p (MPa) = 0.00980665 * G * H
+HEAD_MPa_PER_M = 0.00980665
+
+# Default chunk size (samples) for streamed level histories
+CHUNK_SAMPLES = 262144
+
+# The HTTP endpoint processes ~300k (CSV) to ~500k (raw float) samples/s in one request, so the
+# default keeps a request to ~6-10 s, well inside the hosting router's 30 s timeout; larger
+# histories must be run offline with `python fatigue.py ...`
+HTTP_MAX_SAMPLES = int(os.environ.get('API650_FATIGUE_HTTP_MAX_SAMPLES', '3000000'))
+
+
+class ReversalFilter:
+    """Peak-valley extraction with a hysteresis gate, fed chunk by chunk"""
+
+    def __init__(self, gate=0.0):
+        self.gate = gate
+        self._started = False
+        self._dir = 0
+        self._cand = None
+
+    def feed(self, values):
+        """Return the turning points confirmed by this chunk"""
+        out = []
+        gate = self.gate
+        d = self._dir
+        cand = self._cand
+        i = 0
+        n = len(values)
+        if not self._started and n:
+            # First sample always starts the reversal sequence
+            cand = values[0]
+            out.append(cand)
+            self._started = True
+            i = 1
+        while i < n:
+            x = values[i]
+            i += 1
+            if d > 0:
+                if x >= cand:
+                    cand = x
+                elif cand - x > gate:
+                    out.append(cand); d = -1; cand = x
+            elif d < 0:
+                if x <= cand:
+                    cand = x
+                elif x - cand > gate:
+                    out.append(cand); d = 1; cand = x
+            else:
+                if x - cand > gate:
+                    d = 1; cand = x
+                elif cand - x > gate:
+                    d = -1; cand = x
+        self._dir = d
+        self._cand = cand
+        return out
+
+    def flush(self):
+        """Return the pending extreme at end of history"""
+        if self._dir == 0:
+            return []
+        self._dir = 0
+        return [self._cand]
+
+
+class RainflowCounter:
+    """Incremental rainflow count (ASTM E1049 four-point method)"""
+
+    def __init__(self, sink, gate=0.0):
+        # sink(range, mean, count) receives every closed cycle (count 1.0) and residue half cycles (0.5)
+        self.sink = sink
+        self._filter = ReversalFilter(gate)
+        self._stack = []
+
+    def feed(self, values):
+        stack = self._stack
+        sink = self.sink
+        for r in self._filter.feed(values):
+            stack.append(r)
+            while len(stack) >= 4:
+                x = abs(stack[-1] - stack[-2])
+                y = abs(stack[-2] - stack[-3])
+                z = abs(stack[-3] - stack[-4])
+                if y <= x and y <= z:
+                    sink(y, 0.5 * (stack[-2] + stack[-3]), 1.0)
+                    del stack[-3:-1]
+                else:
+                    break
+
+    def close(self):
+        """Count the residue as half cycles once the history ends"""
+        stack = self._stack
+        stack.extend(self._filter.flush())
+        for i in range(1, len(stack)):
+            rng = abs(stack[i] - stack[i - 1])
+            if rng > 0:
+                self.sink(rng, 0.5 * (stack[i] + stack[i - 1]), 0.5)
+        self._stack = []
+
+
+def sn_cycles_to_failure(S_MPa, fat_MPa=71.0, m1=3.0, m2=5.0, N_ref=2e6, N_knee=1e7):
+    """Bilinear S-N curve for welded details (IIW/EN 1993-1-9 style FAT class)"""
+    if S_MPa <= 0:
+        return float('inf')
+    S_knee = fat_MPa * (N_ref / N_knee) ** (1.0 / m1)
+    if S_MPa >= S_knee:
+        return N_ref * (fat_MPa / S_MPa) ** m1
+    return N_knee * (S_knee / S_MPa) ** m2
+
+
+class CourseDamage:
+    """Miner's rule accumulator for one shell course"""
+
+    def __init__(self, course, z_bottom_m, k_MPa_per_m, fat_MPa, bin_MPa):
+        self.course = course
+        self.z_bottom_m = z_bottom_m
+        self.k = k_MPa_per_m
+        self.fat_MPa = fat_MPa
+        self.bin_MPa = bin_MPa
+        self.cycles = 0.0
+        self.damage = 0.0
+        self.max_range = 0.0
+        self.histogram = {}
+        self.counter = RainflowCounter(self._add)
+
+    def _add(self, rng, mean, count):
+        self.cycles += count
+        self.damage += count / sn_cycles_to_failure(rng, self.fat_MPa)
+        if rng > self.max_range:
+            self.max_range = rng
+        b = int(rng // self.bin_MPa)
+        self.histogram[b] = self.histogram.get(b, 0.0) + count
+
+    def feed_levels(self, levels):
+        # sigma = p*D/(2t) with p from head above course bottom; monotone in level
+        z = self.z_bottom_m; k = self.k
+        self.counter.feed([k * (h - z) if h > z else 0.0 for h in levels])
+
+
+def course_stress_factors(D_m, G, course_t_mm, plate_width_mm, CA_mm=0.0):
+    """Per-course (bottom elevation m, MPa per m of head) with course 1 at the bottom"""
+    rows = []
+    for i, t in enumerate(course_t_mm):
+        t_eff = max(float(t) - CA_mm, 1e-6)
+        z_bottom = i * plate_width_mm / 1000.0
+        k = HEAD_MPa_PER_M * G * D_m / (2.0 * (t_eff / 1000.0))
+        rows.append((z_bottom, k))
+    return rows
+
+
+def iter_csv_levels(path, column='level_m', chunk=CHUNK_SAMPLES):
+    """Yield level chunks from a CSV file without loading it"""
+    with open(path, 'r', newline='') as fh:
+        reader = csv.reader(fh)
+        header = next(reader, None)
+        if header is None:
+            return
+        buf = []
+        if column in header:
+            col = header.index(column)
+        else:
+            # Only a headerless file (numeric first row) falls back to the first column
+            try:
+                buf.append(float(header[0]))
+            except (ValueError, IndexError):
+                raise ValueError(f'column {column} not in header')
+            col = 0
+        for row in reader:
+            try:
+                buf.append(float(row[col]))
+            except (ValueError, IndexError):
+                continue  # sensor dropout / blank row
+            if len(buf) >= chunk:
+                yield buf
+                buf = []
+        if buf:
+            yield buf
+
+
+def iter_parquet_levels(path, column='level_m', chunk=CHUNK_SAMPLES):
+    """Yield level chunks from a Parquet file (requires pyarrow)"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('pyarrow is required to read Parquet level histories')
+    pf = pq.ParquetFile(path)
+    for batch in pf.iter_batches(batch_size=chunk, columns=[column]):
+        yield [v for v in batch.column(0).to_pylist() if v is not None]
+
+
+def iter_raw_levels(path, typecode='d', chunk=CHUNK_SAMPLES):
+    """Yield level chunks from a raw little-endian float32/float64 file via mmap"""
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            view = memoryview(mm)
+            size = 8 if typecode == 'd' else 4
+            usable = len(view) - len(view) % size
+            values = view[:usable].cast(typecode)
+            try:
+                for start in range(0, len(values), chunk):
+                    yield values[start:start + chunk].tolist()
+            finally:
+                values.release()
+                view.release()
+        finally:
+            mm.close()
+
+
+def iter_level_file(path, column='level_m', chunk=CHUNK_SAMPLES):
+    """Pick a chunked reader from the file extension"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.parquet', '.pq'):
+        return iter_parquet_levels(path, column, chunk)
+    if ext in ('.f64', '.bin'):
+        return iter_raw_levels(path, 'd', chunk)
+    if ext == '.f32':
+        return iter_raw_levels(path, 'f', chunk)
+    return iter_csv_levels(path, column, chunk)
+
+
+def estimate_samples(path, column='level_m'):
+    """Sample count of a level file without reading it (CSV estimated from its last 64 KB)"""
+    ext = os.path.splitext(path)[1].lower()
+    size = os.path.getsize(path)
+    if ext in ('.f64', '.bin'):
+        return size // 8
+    if ext == '.f32':
+        return size // 4
+    if ext in ('.parquet', '.pq'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError('pyarrow is required to read Parquet level histories')
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, 'rb') as fh:
+        head = fh.read(65536)
+        first = head.find(b'\n') + 1   # skip the header (or first) row
+        if first == 0:
+            return 1
+        if len(head) == size:
+            return max(1, head.count(b'\n', first) + (not head.endswith(b'\n')))
+        # Rows usually widen as timestamps grow, so measure row width at the end of the file;
+        # this errs low and limit_samples still enforces the exact cap while streaming
+        fh.seek(max(first, size - 65536))
+        tail = fh.read()
+    lines = tail.count(b'\n')
+    if lines == 0:
+        return 1
+    return int((size - first) / (len(tail) / lines))
+
+
+def limit_samples(level_chunks, max_samples):
+    """Pass chunks through, failing once more than max_samples have been read"""
+    n = 0
+    for chunk in level_chunks:
+        n += len(chunk)
+        if n > max_samples:
+            raise ValueError(f'level history exceeds {max_samples} samples; run it offline with python fatigue.py')
+        yield chunk
+
+
+def fill_cycle_fatigue(level_chunks, D_m, G, course_t_mm, plate_width_mm=2000.0, CA_mm=0.0,
+                       sample_rate_hz=1.0, level_gate_m=0.01, fat_MPa=71.0, bin_MPa=5.0):
+    """Rainflow count hydrostatic hoop stress per course and sum Miner damage"""
+    courses = [CourseDamage(i + 1, z, k, fat_MPa, bin_MPa)
+               for i, (z, k) in enumerate(course_stress_factors(D_m, G, course_t_mm, plate_width_mm, CA_mm))]
+    # Stress is monotone in level, so only level turning points can be stress turning points:
+    # filter noise once on the level signal and feed courses the reversals only.
+    level_filter = ReversalFilter(level_gate_m)
+    n_samples = 0
+    h_min = float('inf'); h_max = float('-inf')
+    for chunk in level_chunks:
+        if not chunk:
+            continue
+        n_samples += len(chunk)
+        lo = min(chunk); hi = max(chunk)
+        if lo < h_min: h_min = lo
+        if hi > h_max: h_max = hi
+        reversals = level_filter.feed(chunk)
+        if reversals:
+            for c in courses:
+                c.feed_levels(reversals)
+    tail = level_filter.flush()
+    for c in courses:
+        if tail:
+            c.feed_levels(tail)
+        c.counter.close()
+
+    duration_years = n_samples / sample_rate_hz / (365.25 * 86400.0) if sample_rate_hz > 0 else 0.0
+    rows = []
+    for c in courses:
+        life = duration_years / c.damage if c.damage > 0 else float('inf')
+        rows.append({
+            'course': c.course,
+            'bottom_elevation_m': round(c.z_bottom_m, 3),
+            'stress_per_m_head_MPa': round(c.k, 4),
+            'cycles': round(c.cycles, 1),
+            'max_stress_range_MPa': round(c.max_range, 3),
+            'damage': c.damage,
+            'fatigue_life_years': None if math.isinf(life) else round(life, 1),
+            'range_histogram': [
+                {'range_from_MPa': b * bin_MPa, 'range_to_MPa': (b + 1) * bin_MPa, 'cycles': round(n, 1)}
+                for b, n in sorted(c.histogram.items())
+            ]
+        })
+    return {
+        'samples': n_samples,
+        'duration_years': round(duration_years, 4),
+        'level_min_m': None if n_samples == 0 else round(h_min, 3),
+        'level_max_m': None if n_samples == 0 else round(h_max, 3),
+        'courses': rows
+    }
+
+
+def main(argv=None):
+    """Offline run for histories too long for one HTTP request; prints or writes the JSON report"""
+    ap = argparse.ArgumentParser(description='Fill-cycle fatigue screening from a level history file')
+    ap.add_argument('level_file')
+    ap.add_argument('--column', default='level_m')
+    ap.add_argument('--D', type=float, required=True, help='tank diameter (m)')
+    ap.add_argument('--G', type=float, default=1.0)
+    ap.add_argument('--course-tr-mm', required=True, help='comma separated, bottom course first')
+    ap.add_argument('--plate-width-mm', type=float, default=2000.0)
+    ap.add_argument('--CA', type=float, default=0.0)
+    ap.add_argument('--sample-rate-hz', type=float, default=1.0)
+    ap.add_argument('--level-gate-m', type=float, default=0.01)
+    ap.add_argument('--fat-class-MPa', type=float, default=71.0)
+    ap.add_argument('--out', help='write the report here instead of stdout')
+    args = ap.parse_args(argv)
+    result = fill_cycle_fatigue(
+        iter_level_file(args.level_file, args.column), args.D, args.G,
+        [float(t) for t in args.course_tr_mm.split(',')], args.plate_width_mm, args.CA,
+        args.sample_rate_hz, args.level_gate_m, args.fat_class_MPa)
+    result['fat_class_MPa'] = args.fat_class_MPa
+    text = json.dumps(result, indent=1)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(text)
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
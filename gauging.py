@@ -0,0 +1,200 @@
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+GAUGE_DIR = os.environ.get('API650_GAUGE_DIR', 'data/gauge_tables')
+
+MAGIC = b'API650G1'
+ALPHA_CARBON_STEEL_PER_C = 1.116e-5   # API MPMS 2.2A: 6.2e-6 /degF
+BOTTOM_SHAPES = ('flat', 'cone_up', 'cone_down')
+STEP_MM_RANGE = (0.5, 50.0)
+MAX_POINTS = int(os.environ.get('API650_GAUGE_MAX_POINTS', '200000'))
+_TANK_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def shell_temperature_C(liquid_C, ambient_C=None, insulated=False):
+    """API MPMS 12.1.1: Ts = (7 Tl + Ta) / 8 for uninsulated shells"""
+    if insulated or ambient_C is None:
+        return liquid_C
+    return (7.0 * liquid_C + ambient_C) / 8.0
+
+
+def ctsh(T_shell_C, T_ref_C, alpha=ALPHA_CARBON_STEEL_PER_C):
+    """Correction for the effect of temperature on the steel shell: 1 + 2 a dT + a^2 dT^2"""
+    dT = T_shell_C - T_ref_C
+    return 1.0 + 2.0 * alpha * dT + (alpha * dT) ** 2
+
+
+def _bottom_volume(h, R, hb, shape):
+    """Liquid volume at level h within the conical bottom zone 0 <= h <= hb (datum = lowest point)"""
+    if shape == 'cone_up':
+        # Centre raised hb above the shell junction
+        r0 = R * (1.0 - h / hb)
+        return 2.0 * math.pi * ((h - hb) * (R * R - r0 * r0) / 2.0 + hb / R * (R ** 3 - r0 ** 3) / 3.0)
+    # cone_down: centre sump hb below the shell junction
+    return math.pi * R * R * h ** 3 / (3.0 * hb * hb)
+
+
+def build_strapping(D_m, H_m, course_diameters_m=None, plate_width_mm=2000.0, bottom='flat',
+                    bottom_slope=0.0, deadwood=None, step_mm=1.0):
+    """Height (m) and volume (m3) arrays at reference temperature, heights from the lowest bottom point"""
+    if bottom not in BOTTOM_SHAPES:
+        raise ValueError(f"bottom_shape must be one of {', '.join(BOTTOM_SHAPES)}")
+    if not STEP_MM_RANGE[0] <= step_mm <= STEP_MM_RANGE[1]:
+        raise ValueError(f'step_mm must be between {STEP_MM_RANGE[0]} and {STEP_MM_RANGE[1]}')
+    if D_m <= 0 or H_m <= 0 or plate_width_mm <= 0:
+        raise ValueError('D, H and plate_width_mm must be positive')
+    pw = plate_width_mm / 1000.0
+    diameters = [float(d) for d in (course_diameters_m or [])] or [D_m] * max(1, math.ceil(H_m / pw))
+    R1 = diameters[0] / 2.0
+    hb = R1 * bottom_slope if bottom in ('cone_up', 'cone_down') else 0.0
+    junction = hb if bottom == 'cone_down' else 0.0   # datum -> shell/bottom junction
+    # Cumulative shell volume at each course top, measured from the junction
+    course_area = [math.pi * d * d / 4.0 for d in diameters]
+    cum = [0.0]
+    for a in course_area:
+        cum.append(cum[-1] + a * pw)
+
+    def shell_volume(z):
+        i = min(int(z / pw), len(course_area) - 1)
+        return cum[i] + course_area[i] * (z - i * pw)
+
+    # Level where the bottom zone ends and full shell cross-section applies
+    zone_top = hb
+    V_zone_top = _bottom_volume(hb, R1, hb, bottom) if hb > 0 else 0.0
+    # Shell volume between junction and zone_top is already in the bottom zone for cone_up
+    V_offset = V_zone_top - shell_volume(zone_top - junction) if hb > 0 else 0.0
+
+    top = H_m + junction
+    n = int(round(top / (step_mm / 1000.0))) + 1
+    if n > MAX_POINTS:
+        raise ValueError(f'table would have {n} points (limit {MAX_POINTS}); use a larger step_mm')
+    levels = [min(k * step_mm / 1000.0, top) for k in range(n)]
+    if levels[-1] < top:
+        levels.append(top)   # close the table on the partial last step
+    heights = array('d')
+    volumes = array('d')
+    dw = [(float(d['from_m']), float(d['to_m']), float(d['volume_m3'])) for d in (deadwood or [])]
+    for h in levels:
+        if h < zone_top:
+            v = _bottom_volume(h, R1, hb, bottom)
+        else:
+            v = shell_volume(h - junction) + V_offset
+        for lo, hi, vol in dw:
+            # Deadwood displaces its volume uniformly over its height range
+            if h > lo:
+                v -= vol * (min(h, hi) - lo) / (hi - lo) if hi > lo else vol
+        heights.append(h)
+        volumes.append(v)
+    for k in range(1, len(volumes)):
+        # Guard monotonicity for inverse lookups (deadwood can flatten segments)
+        if volumes[k] < volumes[k - 1]:
+            volumes[k] = volumes[k - 1]
+    return heights, volumes
+
+
+def _path(tank_id):
+    if not _TANK_ID.match(tank_id or ''):
+        raise ValueError('invalid tank id')
+    return os.path.join(GAUGE_DIR, tank_id + '.gauge')
+
+
+def save_table(tank_id, heights, volumes, meta):
+    """Write header + packed float64 arrays atomically so readers never see a partial table"""
+    path = _path(tank_id)
+    os.makedirs(GAUGE_DIR, exist_ok=True)
+    meta = dict(meta, n=len(heights))
+    header = json.dumps(meta).encode()
+    header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 8)   # align arrays to 8 bytes
+    tmp = path + '.tmp%d' % os.getpid()
+    with open(tmp, 'wb') as fh:
+        fh.write(MAGIC + struct.pack('<I', len(header)) + header)
+        heights.tofile(fh)
+        volumes.tofile(fh)
+    os.replace(tmp, path)
+    return path
+
+
+class GaugeTable:
+    """Memory-mapped strapping table; pages are shared between worker processes"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            self.mtime = os.fstat(fh.fileno()).st_mtime_ns
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:8] != MAGIC:
+            raise ValueError('not a gauge table: %s' % path)
+        (hlen,) = struct.unpack('<I', self._mm[8:12])
+        self.meta = json.loads(self._mm[12:12 + hlen])
+        n = self.meta['n']
+        start = 12 + hlen
+        view = memoryview(self._mm)
+        self.heights = view[start:start + 8 * n].cast('d')
+        self.volumes = view[start + 8 * n:start + 16 * n].cast('d')
+        self.h_max = self.heights[n - 1]
+        self.v_max = self.volumes[n - 1]
+
+    def volume(self, h):
+        """Interpolated reference-temperature volume at level h (None when off the table)"""
+        hs = self.heights
+        if h < 0 or h > self.h_max:
+            return None
+        i = bisect_right(hs, h)
+        if i >= len(hs):
+            return self.volumes[-1]
+        h0 = hs[i - 1]; h1 = hs[i]
+        v0 = self.volumes[i - 1]; v1 = self.volumes[i]
+        return v0 + (v1 - v0) * (h - h0) / (h1 - h0)
+
+    def height(self, v):
+        """Inverse lookup: lowest level holding volume v"""
+        vs = self.volumes
+        if v < 0 or v > self.v_max:
+            return None
+        i = bisect_left(vs, v)
+        if i == 0:
+            return self.heights[0]
+        v0 = vs[i - 1]; v1 = vs[i]
+        h0 = self.heights[i - 1]; h1 = self.heights[i]
+        return h0 + (h1 - h0) * (v - v0) / (v1 - v0) if v1 > v0 else h0
+
+    def volumes_at(self, levels, T_shell_C=None):
+        f = ctsh(T_shell_C, self.meta['reference_temperature_C']) if T_shell_C is not None else 1.0
+        out = []
+        for h in levels:
+            v = self.volume(h)
+            out.append(None if v is None else v * f)
+        return out
+
+    def heights_at(self, volumes, T_shell_C=None):
+        f = ctsh(T_shell_C, self.meta['reference_temperature_C']) if T_shell_C is not None else 1.0
+        return [self.height(v / f) for v in volumes]
+
+
+_tables = {}
+_lock = threading.Lock()
+
+
+def get_table(tank_id):
+    """Per-process cache of open tables; reopened when the file is rebuilt"""
+    path = _path(tank_id)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    table = _tables.get(tank_id)
+    if table is None or table.mtime != mtime:
+        with _lock:
+            table = _tables.get(tank_id)
+            if table is None or table.mtime != mtime:
+                table = GaugeTable(path)
+                _tables[tank_id] = table
+    return table
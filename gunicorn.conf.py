@@ -0,0 +1,6 @@
+# Loaded automatically by gunicorn from the working directory
+import admission
+
+worker_class = 'gthread'
+# One thread per running or queued request so parked bulk calls cannot starve interactive ones
+threads = admission.required_threads()
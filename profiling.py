@@ -0,0 +1,295 @@
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+from flask import abort, g, jsonify, request, Response
+
+
+# Off unless explicitly enabled; the X-Profile-Token header is required for on-demand and admin access
+PROFILING_ENABLED = os.environ.get('API650_PROFILING_ENABLED', '0') == '1'
+PROFILE_TOKEN = os.environ.get('API650_PROFILE_TOKEN', '')
+PROFILE_DIR = os.environ.get('API650_PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_RATE = float(os.environ.get('API650_PROFILE_SAMPLE_RATE', '0'))   # fraction of requests
+PROFILE_MAX_PER_MIN = int(os.environ.get('API650_PROFILE_MAX_PER_MIN', '6'))     # random mode cap
+PROFILE_INTERVAL_S = float(os.environ.get('API650_PROFILE_INTERVAL_MS', '1')) / 1000.0
+PROFILE_KEEP = int(os.environ.get('API650_PROFILE_KEEP', '200'))
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a background thread into collapsed stacks
+
+    Each stack accumulates the measured seconds since the previous sample rather than a count:
+    the sampler cannot wake every interval while a CPU-bound handler holds the GIL.
+    """
+
+    def __init__(self, thread_id, interval_s=PROFILE_INTERVAL_S):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        stacks = self.stacks
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval_s):
+            now = time.perf_counter()
+            gap, last = now - last, now
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if names:
+                key = ';'.join(reversed(names))
+                stacks[key] = stacks.get(key, 0.0) + gap
+
+
+class _RandomBudget:
+    """Sliding one-minute cap on randomly sampled requests"""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._hits = deque()
+        self._lock = threading.Lock()
+
+    def take(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._hits and now - self._hits[0] > 60.0:
+                self._hits.popleft()
+            if len(self._hits) >= self.per_minute:
+                return False
+            self._hits.append(now)
+            return True
+
+
+_budget = _RandomBudget(PROFILE_MAX_PER_MIN)
+
+
+def _token_ok():
+    # Header only: query strings end up in access logs
+    value = request.headers.get('X-Profile-Token', '')
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(value.encode(), PROFILE_TOKEN.encode())
+
+
+def _requested_mode():
+    """Return 'sample', 'cprofile' or None for the current request"""
+    flag = request.headers.get('X-Profile') or request.args.get('__profile')
+    if flag and _token_ok():
+        return 'cprofile' if flag == 'cprofile' else 'sample'
+    # Random sampling only spends the per-minute budget on API handlers, not assets
+    if (PROFILE_SAMPLE_RATE > 0 and request.path.startswith('/api/')
+            and random.random() < PROFILE_SAMPLE_RATE and _budget.take()):
+        return 'sample'
+    return None
+
+
+def collapsed_text(stacks):
+    # Brendan Gregg collapsed format; weights in milliseconds of wall time
+    return ''.join(f'{k} {max(1, round(v * 1000.0))}\n' for k, v in sorted(stacks.items()))
+
+
+def speedscope_json(profile_id, meta, stacks):
+    frames = []
+    index = {}
+    samples = []
+    weights = []
+    for key, seconds in stacks.items():
+        row = []
+        for name in key.split(';'):
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({'name': name})
+            row.append(index[name])
+        samples.append(row)
+        weights.append(seconds * 1000.0)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': f"{meta['method']} {meta['path']} ({profile_id})",
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights
+        }],
+        'exporter': 'api650 profiling'
+    }
+
+
+def _prune():
+    metas = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith('.json'))
+    for name in metas[:max(0, len(metas) - PROFILE_KEEP)]:
+        stem = name[:-5]
+        for ext in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, stem + ext))
+            except OSError:
+                pass
+
+
+def _new_id(started):
+    # Time-ordered ids so pruning and listing sort chronologically
+    return time.strftime('%Y%m%dT%H%M%S', time.gmtime(started)) + '-' + uuid.uuid4().hex[:8]
+
+
+def _save(meta, elapsed_s, sampler=None, profiler=None):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = meta['id']
+    meta = dict(meta, duration_ms=round(elapsed_s * 1000.0, 3))
+    if sampler is not None:
+        meta['stacks'] = sampler.stacks
+    if profiler is not None:
+        profiler.dump_stats(os.path.join(PROFILE_DIR, profile_id + '.prof'))
+    with open(os.path.join(PROFILE_DIR, profile_id + '.json'), 'w') as fh:
+        json.dump(meta, fh)
+    _prune()
+    return profile_id
+
+
+def _load(profile_id):
+    # ids are generated server side; reject anything that could escape PROFILE_DIR
+    if not profile_id.replace('-', '').isalnum():
+        abort(404)
+    path = os.path.join(PROFILE_DIR, profile_id + '.json')
+    if not os.path.isfile(path):
+        abort(404)
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def _require_admin():
+    if not PROFILING_ENABLED or not _token_ok():
+        abort(404)
+
+
+def list_profiles():
+    _require_admin()
+    rows = []
+    if os.path.isdir(PROFILE_DIR):
+        for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+            if name.endswith('.json'):
+                meta = _load(name[:-5])
+                meta.pop('stacks', None)
+                rows.append(meta)
+    return jsonify({'profiles': rows})
+
+
+def get_profile(profile_id):
+    _require_admin()
+    meta = _load(profile_id)
+    fmt = request.args.get('format', 'speedscope')
+    if meta['mode'] == 'cprofile':
+        # Deterministic profiles carry no stack samples; serve pstats text or the raw dump
+        prof_path = os.path.join(PROFILE_DIR, profile_id + '.prof')
+        if fmt == 'prof':
+            with open(prof_path, 'rb') as fh:
+                return Response(fh.read(), mimetype='application/octet-stream')
+        limit = request.args.get('limit', 40, type=int) or 40
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in ('cumulative', 'tottime', 'ncalls', 'name', 'filename'):
+            sort = 'cumulative'
+        out = io.StringIO()
+        pstats.Stats(prof_path, stream=out).sort_stats(sort).print_stats(limit)
+        return Response(out.getvalue(), mimetype='text/plain')
+    stacks = meta.get('stacks', {})
+    if fmt == 'collapsed':
+        return Response(collapsed_text(stacks), mimetype='text/plain')
+    return jsonify(speedscope_json(profile_id, meta, stacks))
+
+
+def init_app(app):
+    """Register profiling hooks and admin routes; no-op unless enabled
+
+    Call after admission.init_app so the profile starts once the request is admitted
+    and does not include its queue wait.
+    """
+    if not PROFILING_ENABLED:
+        return
+
+    @app.before_request
+    def _start_profile():
+        if request.path.startswith('/admin/profiles'):
+            return
+        mode = _requested_mode()
+        if mode is None:
+            return
+        g._profile = {'mode': mode, 'started': time.time(), 't0': time.perf_counter()}
+        if mode == 'cprofile':
+            g._profile['profiler'] = cProfile.Profile()
+            g._profile['profiler'].enable()
+        else:
+            g._profile['sampler'] = StackSampler(threading.get_ident())
+            g._profile['sampler'].start()
+
+    @app.after_request
+    def _finish_profile(response):
+        state = g.pop('_profile', None)
+        if state is None:
+            return response
+        profiler = state.get('profiler')
+        sampler = state.get('sampler')
+        # Snapshot request details now: a streamed body finishes after the request context is gone
+        meta = {
+            'id': _new_id(state['started']),
+            'mode': state['mode'],
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'started': state['started'],
+            'streamed': response.is_streamed
+        }
+
+        def finish():
+            elapsed = time.perf_counter() - state['t0']
+            if profiler is not None:
+                profiler.disable()
+            if sampler is not None:
+                sampler.stop()
+            try:
+                _save(meta, elapsed, sampler, profiler)
+            except OSError as e:
+                app.logger.warning('could not store profile: %s', e)
+
+        # The id is known up front so the header goes out before any streamed body
+        response.headers['X-Profile-Id'] = meta['id']
+        if response.is_streamed:
+            # The handler's real work runs while the body is iterated; stop once it is closed
+            response.call_on_close(finish)
+        else:
+            finish()
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(exc):
+        # after_request is skipped on unhandled errors; never leave a sampler running
+        state = g.pop('_profile', None)
+        if state is not None:
+            if state.get('profiler') is not None:
+                state['profiler'].disable()
+            if state.get('sampler') is not None:
+                state['sampler'].stop()
+
+    app.add_url_rule('/admin/profiles', 'list_profiles', list_profiles)
+    app.add_url_rule('/admin/profiles/<profile_id>', 'get_profile', get_profile)
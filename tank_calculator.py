@@ -1,10 +1,25 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 import math
 import json
+import os
+
+import admission
+import anchorage
+import assets
+import cad_export
+import fatigue
+import gauging
+import profiling
 
 app = Flask(__name__)
 CORS(app)
+admission.init_app(app)
+profiling.init_app(app)  # after admission: profiles exclude queue wait
+assets.init_app(app)
+
+# Server-side directory holding long level-history files (CSV / Parquet / raw float)
+LEVEL_HISTORY_DIR = os.environ.get('API650_LEVEL_HISTORY_DIR', 'data/level_history')
 
 
 class API650Calculator:
@@ -79,6 +94,36 @@ class API650Calculator:
         """5.9.7.2 - Transposed Width for Transformed Shell"""
         return W_mm * (t_uniform_mm / t_course_mm)
     
+    @staticmethod
+    def wind_ring_elevations_5_9_7_2(H_m, H1_mm, t_top_mm, plate_width_mm, course_tr_mm=None):
+        """5.9.7.2 - Intermediate Wind Girder Elevations (m from bottom) via Transformed Shell"""
+        if course_tr_mm:
+            t_uniform = min(course_tr_mm)
+        else:
+            t_uniform = t_top_mm
+        num_courses = max(1, math.ceil(H_m / (plate_width_mm/1000.0)))
+        physical_course_thk = course_tr_mm if course_tr_mm else [t_top_mm]*num_courses
+        # build transformed heights
+        Wtr = []
+        for i in range(num_courses):
+            t_i = physical_course_thk[i]
+            Wtr.append( API650Calculator.transpose_width_5_9_7_2(plate_width_mm, t_uniform, t_i) )
+        cum = 0.0; rings = []; z_phys = 0.0
+        # map transformed height to physical elevation from top downward
+        remaining = H_m * 1000.0
+        i = 0
+        while remaining > 0 and i < len(Wtr):
+            cum += Wtr[i]
+            z_phys += plate_width_mm
+            if cum >= H1_mm - 1e-6 and remaining - plate_width_mm > 0:
+                # place ring at this physical elevation below top
+                rings.append(z_phys/1000.0)  # meters from top
+                cum = 0.0
+            remaining -= plate_width_mm
+            i += 1
+        # Convert to elevations from bottom
+        return [round(H_m - z, 3) for z in rings][::-1]
+    
     @staticmethod
     def shell_thickness_5_6(H_local_m, D_m, G, S_allow_MPa, E, CA_mm):
         """5.6 - Shell Thickness (Hydrostatic)"""
@@ -281,7 +326,8 @@ except Exception:
 
 @app.route('/')
 def index():
-    return render_template('tank_calculator.html')
+    # Page has no per-request state; render once and let clients revalidate by ETag
+    return assets.cached_page('index', lambda: render_template('tank_calculator.html'))
 
 @app.route('/api/calculate-capacity', methods=['POST'])
 def calculate_capacity():
@@ -365,6 +411,7 @@ def calculate_capacity():
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/calculate-shell', methods=['POST'])
+@admission.route_cost(lambda d: math.ceil(float(d.get('H', 12.0)) / (float(d.get('plate_width_mm', 2000.0)) / 1000.0)))
 def calculate_shell():
     data = request.json
     try:
@@ -468,32 +515,7 @@ def calculate_wind():
         # H1 in mm
         H1 = API650Calculator.wind_unstiffened_height_H1_5_9(D * 1000, t_top, p)
         # Transposed shell method to get ring elevations
-        if course_tr:
-            t_uniform = min(course_tr)
-        else:
-            t_uniform = t_top
-        num_courses = max(1, math.ceil(H / (plate_width_mm/1000.0)))
-        physical_course_thk = course_tr if course_tr else [t_top]*num_courses
-        # build transformed heights
-        Wtr = []
-        for i in range(num_courses):
-            t_i = physical_course_thk[i]
-            Wtr.append( plate_width_mm * (t_uniform / t_i) )
-        cum = 0.0; rings = []; z_phys = 0.0
-        # map transformed height to physical elevation from top downward
-        remaining = H * 1000.0
-        i = 0
-        while remaining > 0 and i < len(Wtr):
-            cum += Wtr[i]
-            z_phys += plate_width_mm
-            if cum >= H1 - 1e-6 and remaining - plate_width_mm > 0:
-                # place ring at this physical elevation below top
-                rings.append(z_phys/1000.0)  # meters from top
-                cum = 0.0
-            remaining -= plate_width_mm
-            i += 1
-        # Convert to elevations from bottom
-        rings_from_bottom = [round(H - z, 3) for z in rings][::-1]
+        rings_from_bottom = API650Calculator.wind_ring_elevations_5_9_7_2(H, H1, t_top, plate_width_mm, course_tr)
         # H2 as max spacing between rings in physical units
         segments = [rings_from_bottom[0]] + [rings_from_bottom[i]-rings_from_bottom[i-1] for i in range(1,len(rings_from_bottom))] + [H - (rings_from_bottom[-1] if rings_from_bottom else 0)]
         H2 = max(segments) if segments else H
@@ -712,7 +734,129 @@ def calculate_anchors():
         return jsonify({'error': str(e)}), 400
 
 
+@app.route('/api/anchorage', methods=['POST'])
+def calculate_anchorage():
+    data = request.json
+    try:
+        D = float(data.get('D', 8.0))
+        P = float(data.get('design_pressure_kPa', 0.0))
+        Pt = float(data.get('test_pressure_kPa', 1.25 * P))
+        Pf = float(data.get('failure_pressure_kPa', 0.0))
+        th = float(data.get('roof_thickness_mm', 5.0))  # corroded roof plate
+        # W1/W2/W3 per Table 5.21b; fall back to the legacy single dead weight
+        dead_weight = float(data.get('dead_weight_N', 500000))
+        W1 = float(data.get('W1_N', dead_weight))
+        W2 = float(data.get('W2_N', W1))
+        W3 = float(data.get('W3_N', W2))
+        cases = anchorage.uplift_cases(
+            D, P, Pt, Pf, th,
+            Mwh_Nm=float(data.get('wind_moment_Nm', 0.0)),
+            PWR_kPa=float(data.get('wind_roof_uplift_kPa', 0.0)),
+            Mrw_Nm=float(data.get('seismic_moment_Nm', 0.0)),
+            Av=float(data.get('Av', 0.0)),
+            W1_N=W1, W2_N=W2, W3_N=W3,
+            Fp=float(data.get('Fp', 0.4)),
+            bolt_fy_MPa=float(data.get('bolt_fy_MPa', 250.0)),
+            frangible=bool(data.get('frangible_roof', False))
+        )
+        result = anchorage.design_anchorage(
+            D, cases,
+            CA_bolt_mm=float(data.get('CA_anchor_bolt', 3.0)),
+            num_bolts=data.get('num_bolts'),
+            direction_deg=float(data.get('load_direction_deg', 0.0)),
+            chair_height_mm=float(data.get('chair_height_mm', 300.0)),
+            max_bolt_d_mm=float(data.get('max_bolt_diameter_mm', 52)),
+            bolt_eccentricity_mm=float(data['bolt_eccentricity_mm']) if data.get('bolt_eccentricity_mm') is not None else None
+        )
+        N = result['N']
+        response = {
+            'anchorage_required': result['required'],
+            'number_of_bolts': N if result['required'] else 0,
+            'bolt_spacing_m': round(math.pi * D / N, 3) if result['required'] else 0,
+            'load_cases': [
+                {
+                    'case': name,
+                    'uplift_U_N': round(a + b, 0),
+                    'max_bolt_load_N': round(max(row), 0),
+                    'allowable_bolt_stress_MPa': round(allow, 1)
+                }
+                for (name, a, b, allow), row in zip(cases, result['matrix'])
+            ],
+            'formula': 'Table 5.21b: U per case; t_b(theta) = [U_uniform + (4M/D) cos(theta)] / N; A_req = t_b / S_allow'
+        }
+        if result['required']:
+            gov = result['governing']
+            response.update({
+                'governing_case': gov['case'],
+                'governing_bolt_position': gov['position'],
+                'bolt_load_N': round(gov['F'], 0),
+                'bolt_area_required_mm2': round(gov['A_req'], 1),
+                'bolt_diameter_mm': result['bolt_d_mm'],
+                'bolt_net_area_mm2': round(result['bolt_net_area_mm2'], 1),
+                'chair': result['chair']
+            })
+        if data.get('include_position_matrix'):
+            response['position_matrix_N'] = [[round(f, 0) for f in row] for row in result['matrix']]
+        return jsonify(response)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/export/<fmt>', methods=['POST'])
+@admission.route_cost(lambda d: int(d.get('segments', 72)) / 10.0, bulk=True)
+def export_geometry(fmt):
+    data = request.json
+    try:
+        if fmt not in ('dxf', 'mesh'):
+            return jsonify({'error': f'unknown export format {fmt}'}), 404
+        D = float(data.get('D', 8.0))
+        H = float(data.get('H', 12.0))
+        plate_width_mm = float(data.get('plate_width_mm', 2000.0))
+        if D <= 0 or H <= 0 or plate_width_mm <= 0:
+            return jsonify({'error': 'D, H and plate_width_mm must be positive'}), 400
+        course_tr = data.get('course_tr_mm') or []
+        rings = data.get('ring_elevations_from_bottom_m')
+        if rings is None:
+            # Same girder placement as /api/calculate-wind
+            t_top = float(data.get('t_top', 6))
+            V_mph = float(data.get('V', 150)) * 0.621371
+            p = API650Calculator.wind_velocity_pressure_5_9_note2(
+                V_mph, float(data.get('Kz', 1.0)), float(data.get('Kzt', 1.0)), float(data.get('Kd', 0.85)),
+                float(data.get('I', 1.0)), float(data.get('Gf', 0.85)))
+            H1 = API650Calculator.wind_unstiffened_height_H1_5_9(D * 1000, t_top, p)
+            rings = API650Calculator.wind_ring_elevations_5_9_7_2(H, H1, t_top, plate_width_mm, course_tr)
+        # Validate everything before streaming starts; errors mid-stream would truncate the file
+        roof_type = data.get('roof_type', 'cone')
+        if roof_type not in cad_export.ROOF_TYPES:
+            return jsonify({'error': f"roof_type must be one of {', '.join(cad_export.ROOF_TYPES)}"}), 400
+        nozzles = cad_export.normalise_nozzles(data.get('nozzles'))
+        segments = int(data.get('segments', 72))
+        lo, hi = cad_export.SEGMENTS_RANGE
+        if not lo <= segments <= hi:
+            return jsonify({'error': f'segments must be between {lo} and {hi}'}), 400
+        parts = cad_export.tank_parts(
+            D, H, plate_width_mm, course_tr,
+            ring_elevations_m=[float(z) for z in rings],
+            ring_width_mm=float(data.get('ring_width_mm', 150.0)),
+            annular_width_mm=float(data.get('annular_width_mm', 0.0)),
+            roof=roof_type,
+            roof_slope=float(data.get('roof_slope', 1.0 / 16.0)),
+            nozzles=nozzles,
+            segments=segments
+        )
+        if fmt == 'dxf':
+            body = cad_export.dxf_stream(parts)
+            mimetype, filename = 'application/dxf', 'tank.dxf'
+        else:
+            body = cad_export.mesh_stream(parts, {'generator': 'api650 cad export', 'D_m': D, 'H_m': H})
+            mimetype, filename = 'application/json', 'tank_mesh.json'
+        return Response(stream_with_context(body), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/nozzles/select', methods=['POST'])
+@admission.route_cost(lambda d: len(d.get('items', [])))
 def nozzle_select():
     data = request.json
     try:
@@ -799,5 +943,138 @@ def nozzle_annexP():
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/gauging/<tank_id>', methods=['POST'])
+@admission.route_cost(bulk=True)
+def gauging_build(tank_id):
+    data = request.json
+    try:
+        D = float(data.get('D', 8.0))
+        H = float(data.get('H', 12.0))
+        step_mm = float(data.get('step_mm', 1.0))
+        T_ref = float(data.get('reference_temperature_C', 15.0))
+        heights, volumes = gauging.build_strapping(
+            D, H,
+            course_diameters_m=data.get('course_diameters_m'),
+            plate_width_mm=float(data.get('plate_width_mm', 2000.0)),
+            bottom=data.get('bottom_shape', 'flat'),
+            bottom_slope=float(data.get('bottom_slope', 0.0)),
+            deadwood=data.get('deadwood'),
+            step_mm=step_mm
+        )
+        gauging.save_table(tank_id, heights, volumes, {
+            'tank_id': tank_id,
+            'D_m': D,
+            'H_m': H,
+            'bottom_shape': data.get('bottom_shape', 'flat'),
+            'bottom_slope': float(data.get('bottom_slope', 0.0)),
+            'step_mm': step_mm,
+            'reference_temperature_C': T_ref
+        })
+        return jsonify({
+            'tank_id': tank_id,
+            'points': len(heights),
+            'max_level_m': round(heights[-1], 4),
+            'max_volume_m3': round(volumes[-1], 3),
+            'reference_temperature_C': T_ref,
+            'formula': 'V(h) = bottom zone (cone) + sum(pi D_i^2 / 4 x course height) - deadwood; V_T = V_ref x CTSh'
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+def _gauge_shell_temperature(data):
+    # Explicit shell temperature wins; otherwise derive it from liquid/ambient
+    if data.get('shell_temperature_C') is not None:
+        return float(data['shell_temperature_C'])
+    if data.get('liquid_temperature_C') is not None:
+        ambient = data.get('ambient_temperature_C')
+        return gauging.shell_temperature_C(float(data['liquid_temperature_C']),
+                                           None if ambient is None else float(ambient),
+                                           bool(data.get('insulated', False)))
+    return None
+
+@app.route('/api/gauging/<tank_id>/volume', methods=['POST'])
+@admission.route_cost(lambda d: len(d.get('levels_m', [])) / 100.0)
+def gauging_volume(tank_id):
+    data = request.json
+    try:
+        table = gauging.get_table(tank_id)
+        if table is None:
+            return jsonify({'error': f'no strapping table for {tank_id}'}), 404
+        T_shell = _gauge_shell_temperature(data)
+        levels = [float(h) for h in data.get('levels_m', [])]
+        return jsonify({
+            'tank_id': tank_id,
+            'shell_temperature_C': T_shell,
+            'volumes_m3': table.volumes_at(levels, T_shell)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/gauging/<tank_id>/height', methods=['POST'])
+@admission.route_cost(lambda d: len(d.get('volumes_m3', [])) / 100.0)
+def gauging_height(tank_id):
+    data = request.json
+    try:
+        table = gauging.get_table(tank_id)
+        if table is None:
+            return jsonify({'error': f'no strapping table for {tank_id}'}), 404
+        T_shell = _gauge_shell_temperature(data)
+        volumes = [float(v) for v in data.get('volumes_m3', [])]
+        return jsonify({
+            'tank_id': tank_id,
+            'shell_temperature_C': T_shell,
+            'levels_m': table.heights_at(volumes, T_shell)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/fatigue/fill-cycles', methods=['POST'])
+@admission.route_cost(lambda d: len(d.get('levels', [])) / 1000.0, bulk=True)
+def fatigue_fill_cycles():
+    data = request.json
+    try:
+        D = float(data.get('D', 8.0))
+        G = float(data.get('G', 1.0))
+        plate_width_mm = float(data.get('plate_width_mm', 2000.0))
+        CA = float(data.get('CA_shell', 0.0))  # 0 = as-built thickness; pass CA for corroded
+        course_tr = data.get('course_tr_mm') or []
+        if not course_tr:
+            H = float(data.get('H', 12.0))
+            t_top = float(data.get('t_top', 6))
+            course_tr = [t_top] * max(1, math.ceil(H / (plate_width_mm / 1000.0)))
+        fat = float(data.get('fat_class_MPa', 71.0))
+        gate = float(data.get('level_gate_m', 0.01))
+        rate = float(data.get('sample_rate_hz', 1.0))
+
+        if data.get('level_file'):
+            # Only files under LEVEL_HISTORY_DIR may be read
+            base = os.path.realpath(LEVEL_HISTORY_DIR)
+            path = os.path.realpath(os.path.join(base, data['level_file']))
+            if not path.startswith(base + os.sep) or not os.path.isfile(path):
+                return jsonify({'error': 'level_file not found'}), 404
+            # Long histories take minutes; keep HTTP runs within budget and point at the CLI
+            n_est = fatigue.estimate_samples(path)
+            if n_est > fatigue.HTTP_MAX_SAMPLES:
+                return jsonify({'error': f'level_file has ~{n_est} samples, above the HTTP limit of '
+                                         f'{fatigue.HTTP_MAX_SAMPLES}; run it offline with python fatigue.py'}), 413
+            chunks = fatigue.limit_samples(fatigue.iter_level_file(path, data.get('level_column', 'level_m')),
+                                           fatigue.HTTP_MAX_SAMPLES)
+        else:
+            chunks = [[float(h) for h in data.get('levels', [])]]
+
+        result = fatigue.fill_cycle_fatigue(chunks, D, G, course_tr, plate_width_mm, CA,
+                                            rate, gate, fat)
+        result.update({
+            'fat_class_MPa': fat,
+            'formula': 'sigma = p*D/(2t), p = 0.00980665*G*(h - z_course); rainflow (ASTM E1049); D = sum n/N (Miner)',
+            'notes': [
+                'Levels are turning-point filtered once with the level gate, then each course is rainflow counted.',
+                'S-N curve: bilinear FAT class (m=3 to 1e7 cycles, m=5 beyond). API 650 has no fatigue rules; screening only.'
+            ]
+        })
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file